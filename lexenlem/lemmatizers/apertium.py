@@ -1,10 +1,19 @@
-import apertium
 from collections import OrderedDict
+from functools import lru_cache
 
-def lemmatize(word, lang):
-    analysis = apertium.analyze(lang, word)
+@lru_cache(maxsize=8)
+def get_analyzer(lang):
+    import apertium
+    return apertium.Analyzer(lang)
+
+@lru_cache(maxsize=131072)
+def _lemmatize(word, lang):
+    analysis = get_analyzer(lang).analyze(word)
     if analysis:
         lemmas = list(OrderedDict.fromkeys([x.split('<')[0] for x in str(analysis[0]).split('/')[1:]]))
     else:
         lemmas = []
-    return list(''.join(lemmas))
\ No newline at end of file
+    return tuple(''.join(lemmas))
+
+def lemmatize(word, lang):
+    return list(_lemmatize(word, lang))
\ No newline at end of file
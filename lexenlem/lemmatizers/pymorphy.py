@@ -1,9 +1,16 @@
-import pymorphy2
+from functools import lru_cache
 
-morph = pymorphy2.MorphAnalyzer()
+@lru_cache(maxsize=1)
+def get_morph():
+    import pymorphy2
+    return pymorphy2.MorphAnalyzer()
 
-def lemmatize(token):
+@lru_cache(maxsize=131072)
+def _lemmatize(token):
     normal_forms = set()
-    for p in morph.parse(token):
+    for p in get_morph().parse(token):
         normal_forms.add(p.normal_form)
-    return list(normal_forms)
\ No newline at end of file
+    return tuple(normal_forms)
+
+def lemmatize(token):
+    return list(_lemmatize(token))
\ No newline at end of file
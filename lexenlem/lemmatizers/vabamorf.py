@@ -1,4 +1,9 @@
-from estnltk import Text
+from functools import lru_cache
+
+@lru_cache(maxsize=131072)
+def _lemmatize(token):
+    from estnltk import Text
+    return tuple(Text(token).lemmas[0].split('|'))
 
 def lemmatize(token):
-    return Text(token).lemmas[0].split('|')
\ No newline at end of file
+    return list(_lemmatize(token))
\ No newline at end of file
@@ -3,6 +3,7 @@ A wrapper/loader for the official conll-u format files.
 """
 import os
 import io
+from operator import itemgetter
 
 FIELD_NUM = 10
 
@@ -34,7 +35,14 @@ class CoNLLFile():
         Load data into a list of sentences, where each sentence is a list of lines,
         and each line is a list of conllu fields.
         """
-        sents, cache = [], []
+        return list(self.iter_conll())
+
+    def iter_conll(self):
+        """
+        Lazily read the data one sentence at a time, in the same format as load_conll().
+        Nothing is cached, so memory stays bounded by the longest sentence.
+        """
+        cache = []
         if self._from_str:
             infile = io.StringIO(self.file)
         else:
@@ -44,7 +52,7 @@ class CoNLLFile():
                 line = line.strip()
                 if len(line) == 0:
                     if len(cache) > 0:
-                        sents.append(cache)
+                        yield cache
                         cache = []
                 else:
                     if line.startswith('#'): # skip comment line
@@ -55,8 +63,7 @@ class CoNLLFile():
                     assert len(array) == FIELD_NUM
                     cache += [array]
         if len(cache) > 0:
-            sents.append(cache)
-        return sents
+            yield cache
 
     @property
     def file(self):
@@ -88,26 +95,32 @@ class CoNLLFile():
         of that field; if more than one, return a list of list. Note that all returned fields are after
         multi-word expansion.
         """
-        assert isinstance(fields, list), "Must provide field names as a list."
-        assert len(fields) >= 1, "Must have at least one field."
-        field_idxs = [FIELD_TO_IDX[f.lower()] for f in fields]
         results = []
-        for sent in self.sents:
-            cursent = []
-            for ln in sent:
-                if '-' in ln[0]: # skip
-                    continue
-                if len(field_idxs) == 1:
-                    cursent += [ln[field_idxs[0]]]
-                else:
-                    cursent += [[ln[fid] for fid in field_idxs]]
-
+        for cursent in self._extract_fields(self.sents, fields):
             if as_sentences:
                 results.append(cursent)
             else:
                 results += cursent
         return results
 
+    def iter_fields(self, fields):
+        """ Same as get(fields, as_sentences=True), but streams the file one sentence at a time
+        without caching it.
+        """
+        return self._extract_fields(self.iter_conll(), fields)
+
+    def _extract_fields(self, sents, fields):
+        """ Yield the given fields of each sentence, skipping multi-word token lines. """
+        assert isinstance(fields, list), "Must provide field names as a list."
+        assert len(fields) >= 1, "Must have at least one field."
+        field_idxs = [FIELD_TO_IDX[f.lower()] for f in fields]
+        getter = itemgetter(*field_idxs)
+        for sent in sents:
+            if len(field_idxs) == 1:
+                yield [getter(ln) for ln in sent if '-' not in ln[0]]
+            else:
+                yield [list(getter(ln)) for ln in sent if '-' not in ln[0]]
+
     def set(self, fields, contents):
         """ Set fields based on contents. If only one field (singleton list) is provided, then a list of content will be expected; otherwise a list of list of contents will be expected.
         """
@@ -132,20 +145,22 @@ class CoNLLFile():
     def write_conll(self, filename):
         """ Write current conll contents to file.
         """
-        conll_string = self.conll_as_string()
         with open(filename, 'w', encoding='utf-8') as outfile:
-            outfile.write(conll_string)
+            outfile.writelines(self.iter_conll_lines())
         return
 
-    def conll_as_string(self):
-        """ Return current conll contents as string
+    def iter_conll_lines(self):
+        """ Yield current conll contents line by line, with a blank line after each sentence.
         """
-        return_string = ""
         for sent in self.sents:
             for ln in sent:
-                return_string += ("\t".join(ln)+"\n")
-            return_string += "\n"
-        return return_string
+                yield "\t".join(ln) + "\n"
+            yield "\n"
+
+    def conll_as_string(self):
+        """ Return current conll contents as string
+        """
+        return "".join(self.iter_conll_lines())
 
     def write_conll_with_lemmas(self, lemmas, filename):
         """ Write a new conll file, but use the new lemmas to replace the old ones."""
@@ -161,8 +176,8 @@ class CoNLLFile():
                             lm = '_'
                         ln[lemma_idx] = lm
                         idx += 1
-                    print("\t".join(ln), file=outfile)
-                print("", file=outfile)
+                    outfile.write("\t".join(ln) + "\n")
+                outfile.write("\n")
         return
 
     def get_mwt_expansions(self):
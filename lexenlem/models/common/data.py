@@ -2,6 +2,7 @@
 Utility functions for data transformations.
 """
 
+import numpy as np
 import torch
 
 import lexenlem.models.common.seq2seq_constant as constant
@@ -12,6 +13,12 @@ def map_to_ids(tokens, vocab):
 
 def get_long_tensor(tokens_list, batch_size, pad_id=constant.PAD_ID):
     """ Convert (list of )+ tokens to a padded LongTensor. """
+    if len(tokens_list[0]) > 0 and not isinstance(tokens_list[0][0], list):
+        # common 2-d case: pad into a numpy buffer and share its memory with the tensor
+        tokens = np.full((batch_size, max(len(s) for s in tokens_list)), pad_id, dtype=np.int64)
+        for i, s in enumerate(tokens_list):
+            tokens[i, :len(s)] = s
+        return torch.from_numpy(tokens)
     sizes = []
     x = tokens_list
     while isinstance(x[0], list):
@@ -34,6 +41,5 @@ def get_float_tensor(features_list, batch_size):
 
 def sort_all(batch, lens):
     """ Sort all fields by descending order of lens, and return the original indices. """
-    unsorted_all = [lens] + [range(len(lens))] + list(batch)
-    sorted_all = [list(t) for t in zip(*sorted(zip(*unsorted_all), reverse=True))]
-    return sorted_all[2:], sorted_all[1]
+    orig_idx = np.argsort(-np.asarray(lens), kind='stable').tolist()
+    return [[field[i] for i in orig_idx] for field in batch], orig_idx
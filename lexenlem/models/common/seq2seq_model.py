@@ -118,10 +118,15 @@ class Seq2SeqModel(nn.Module):
     def cuda(self):
         super().cuda()
         self.use_cuda = True
+        # SOS_tensor is a plain attribute rather than a buffer, so nn.Module does not move it
+        self.SOS_tensor = self.SOS_tensor.cuda()
+        return self
 
     def cpu(self):
         super().cpu()
         self.use_cuda = False
+        self.SOS_tensor = self.SOS_tensor.cpu()
+        return self
 
     def zero_state(self, inputs):
         batch_size = inputs.size(0)
@@ -414,6 +419,9 @@ class Seq2SeqModelCombined(Seq2SeqModel):
                 lem_stump = lem_stump.cuda()
                 lem_mask_stump = lem_mask_stump.cuda()
             if lem_hide.any():
+                # the data loader reuses its batch tensors across epochs, so never modify them in place
+                lem = lem.clone()
+                lem_mask = lem_mask.clone()
                 lem[lem_hide] = lem_stump.repeat(lem[lem_hide].size(0), 1)
                 lem_mask[lem_hide] = lem_mask_stump.repeat(lem_mask[lem_hide].size(0), 1)
 
@@ -482,10 +490,13 @@ class Seq2SeqModelCombined(Seq2SeqModel):
             _, preds = log_probs.squeeze(1).max(1, keepdim=True)
             dec_inputs = self.embedding(preds) # update decoder inputs
             max_len += 1
-            attns.append([x.tolist() for x in attn])
+            if log_attn:
+                attns.append([x.tolist() for x in attn])
+            # copy the step's predictions to the host once instead of syncing per element
+            tokens = preds.squeeze(1).tolist()
             for i in range(batch_size):
                 if not done[i]:
-                    token = preds.data[i][0].item()
+                    token = tokens[i]
                     if token == constant.EOS_ID:
                         done[i] = True
                         total_done += 1
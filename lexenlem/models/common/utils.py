@@ -141,14 +141,15 @@ def prune_decoded_seqs(seqs):
     """
     Prune decoded sequences after EOS token.
     """
-    out = []
-    for s in seqs:
-        if constant.EOS in s:
-            idx = s.index(constant.EOS_TOKEN)
-            out += [s[:idx]]
-        else:
-            out += [s]
-    return out
+    return [prune_decoded_seq(s) for s in seqs]
+
+def prune_decoded_seq(seq):
+    """
+    Prune a single decoded sequence after EOS token.
+    """
+    if constant.EOS in seq:
+        return seq[:seq.index(constant.EOS)]
+    return seq
 
 def prune_hyp(hyp):
     """
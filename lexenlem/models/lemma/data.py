@@ -2,6 +2,9 @@ import random
 import numpy as np
 import os
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import importlib
 import torch
 import sys
 
@@ -14,8 +17,15 @@ from lexenlem.models.common.doc import Document
 from lexenlem.models.common.lexicon import Lexicon
 import json
 
+def outer_lemmatize_words(name, lang, words):
+    """ Lemmatize a chunk of words with an outer lemmatizer module, imported by name so that it can run in a worker process. """
+    lemmatizer = importlib.import_module('lexenlem.lemmatizers.' + name)
+    if name == 'apertium':
+        return [lemmatizer.lemmatize(w, lang) for w in words]
+    return [lemmatizer.lemmatize(w) for w in words]
+
 class DataLoaderCombined:
-    def __init__(self, input_src, batch_size, args, lemmatizer=None, vocab=None, evaluation=False, conll_only=False, skip=None):
+    def __init__(self, input_src, batch_size, args, lemmatizer=None, vocab=None, evaluation=False, conll_only=False, skip=None, sort_during_eval=False):
         self.batch_size = batch_size
         self.args = args
         self.eval = evaluation
@@ -24,6 +34,8 @@ class DataLoaderCombined:
         self.lemmatizer = lemmatizer
         self.morph = args.get('morph', False)
         self.pos = args.get('pos', False)
+        # page-locked batches let unpack_batch copy them to the GPU asynchronously
+        self.pin_memory = args.get('cuda', False) and torch.cuda.is_available()
 
         # check if input source is a file or a Document object
         if isinstance(input_src, str):
@@ -66,76 +78,103 @@ class DataLoaderCombined:
             self.lemmatizer.init_lexicon(data)
 
         data = self.preprocess(data, self.vocab['combined'], args)
-        # shuffle for training
+        # sort for evaluation so that each batch holds words of similar length, callers restore the order with data_orig_idx
+        # src and lem are padded separately, so both lengths count towards the padding of a batch
+        self.data_orig_idx = None
+        if self.eval and sort_during_eval:
+            self.data_orig_idx = sorted(range(len(data)), key=lambda i: len(data[i][0]) + len(data[i][1]), reverse=True)
+            data = [data[i] for i in self.data_orig_idx]
+        # shuffle for training, then bucket by length so that each batch holds words of similar length
         if self.shuffled:
-            indices = list(range(len(data)))
-            random.shuffle(indices)
-            data = [data[i] for i in indices]
+            indices = np.random.permutation(len(data))
+            data = sorted((data[i] for i in indices), key=lambda x: len(x[0]) + len(x[1]))
         self.num_examples = len(data)
 
-        # chunk into batches
-        data = [data[i:i+batch_size] for i in range(0, len(data), batch_size)]
+        # chunk into batches, stored as one list per field
+        data = [[list(field) for field in zip(*data[i:i+batch_size])] for i in range(0, len(data), batch_size)]
         self.data = data
-
-    def make_feats_data(self, data, feats_idx=3):
-        feats_data = []
-        for d in data:
-            feats = d[feats_idx]
-            if '|' in feats:
-                feats_data.extend(feats.split('|'))
-            else:
-                feats_data.append(feats)
-        return feats_data
+        # batches never change after construction, so their tensors are built once and reused every epoch
+        self.batch_cache = [None] * len(data)
 
     def init_vocab(self, data):
         assert self.eval is False, "Vocab file must exist for evaluation"
-        char_data = list("".join(d[0] + d[2] for d in data))
-        pos_data = ['POS=' + d[1] for d in data]
-        feats_data = self.make_feats_data(data)
-        combined_data = char_data + pos_data + feats_data
-        combined_vocab = Vocab(combined_data, self.args['lang'])
+        # count all units in a single pass, merging chars, pos and feats in that order to keep the tie order of ids
+        char_counter, pos_counter, feats_counter = Counter(), Counter(), Counter()
+        for d in data:
+            char_counter.update(d[0])
+            char_counter.update(d[2])
+            pos_counter['POS=' + d[1]] += 1
+            feats_counter.update(d[3].split('|'))
+        char_counter.update(pos_counter)
+        char_counter.update(feats_counter)
+        combined_vocab = Vocab.from_counter(char_counter, self.args['lang'])
         return combined_vocab
 
+    def outer_lemmatize(self, word, pos, args):
+        """ Get the lemma units proposed by the outer lemmatizer. """
+        if type(self.lemmatizer) is Lexicon:
+            return self.lemmatizer.lemmatize(word, pos)
+        elif args['lemmatizer'] == 'apertium':
+            return self.lemmatizer.lemmatize(word, args['lang'].split('_')[0])
+        else:
+            return self.lemmatizer.lemmatize(word)
+
+    def parallel_outer_lemmatize(self, data, args):
+        """ Run the outer lemmatizer over all distinct words in a pool of worker processes. """
+        num_workers = args['num_workers']
+        words = list({d[0]: None for d in data})
+        chunk_size = max(1, len(words) // (4 * num_workers) + 1)
+        chunks = [words[i:i+chunk_size] for i in range(0, len(words), chunk_size)]
+        lemmatize_chunk = partial(outer_lemmatize_words, args['lemmatizer'], args['lang'].split('_')[0])
+        word_lemmas = dict()
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            for chunk, lemmas in zip(chunks, executor.map(lemmatize_chunk, chunks)):
+                word_lemmas.update(zip(chunk, lemmas))
+        return {(d[0], d[1]): word_lemmas[d[0]] for d in data}
+
     def preprocess(self, data, combined_vocab, args):
         processed = []
         eos_after = args.get('eos_after', False)
+        # outer lemmatizers are deterministic, so each (word, pos) pair is analyzed only once
+        outer_lemmas = dict()
+        if self.lemmatizer is not None and type(self.lemmatizer) is not Lexicon and args.get('num_workers', 1) > 1:
+            print("[Running the outer lemmatizer with {} processes...]".format(args['num_workers']))
+            outer_lemmas = self.parallel_outer_lemmatize(data, args)
+        # identical (word, pos, feats) triples share the same source encoding
+        encoded_inputs = dict()
+        # likewise for the edit type and target encodings of each (word, lemma) pair
+        encoded_targets = dict()
         for d in data:
-            edit_type = edit.EDIT_TO_ID[edit.get_edit_type(d[0], d[2])]
-            src = list(d[0])
-            if eos_after:
-                src = [constant.SOS] + src
-            else:
-                src = [constant.SOS] + src + [constant.EOS]
-            pos = ['POS=' + d[1]]
-            feats = []
-            if '|' in d[3]:
-                feats.extend(d[3].split('|'))
-            else:
-                feats.append(d[3])
-            inp = src
-            if self.pos:
-                inp += pos
-            if self.morph:
-                inp += feats
-            if eos_after:
-                inp += [constant.EOS]
-            inp = combined_vocab.map(inp)
+            inp_key = (d[0], d[1], d[3])
+            inp = encoded_inputs.get(inp_key)
+            if inp is None:
+                # the framing tokens have fixed ids, so only the content goes through the vocab
+                units = list(d[0])
+                if self.pos:
+                    units.append('POS=' + d[1])
+                if self.morph:
+                    units.extend(d[3].split('|'))
+                if eos_after:
+                    inp = [constant.SOS_ID, *combined_vocab.map(units), constant.EOS_ID]
+                else:
+                    src_len = len(d[0])
+                    inp = combined_vocab.map(units)
+                    inp = [constant.SOS_ID, *inp[:src_len], constant.EOS_ID, *inp[src_len:]]
+                encoded_inputs[inp_key] = inp
             processed_sent = [inp]
             if self.lemmatizer is None:
-                lem = [constant.SOS, constant.EOS]
+                lem = [constant.SOS_ID, constant.EOS_ID]
             else:
-                if type(self.lemmatizer) is Lexicon:
-                    lem = self.lemmatizer.lemmatize(d[0], d[1])
-                elif args['lemmatizer'] == 'apertium':
-                    lem = self.lemmatizer.lemmatize(d[0], args['lang'].split('_')[0])
-                else:
-                    lem = self.lemmatizer.lemmatize(d[0])
-                lem = [constant.SOS] + lem + [constant.EOS]
-            lem = combined_vocab.map(lem)
+                key = (d[0], d[1])
+                if key not in outer_lemmas:
+                    outer_lemmas[key] = self.outer_lemmatize(d[0], d[1], args)
+                lem = [constant.SOS_ID, *combined_vocab.map(outer_lemmas[key]), constant.EOS_ID]
             processed_sent += [lem]
-            tgt = list(d[2])
-            tgt_in = combined_vocab.map([constant.SOS] + tgt)
-            tgt_out = combined_vocab.map(tgt + [constant.EOS])
+            tgt_key = (d[0], d[2])
+            if tgt_key not in encoded_targets:
+                tgt = combined_vocab.map(d[2])
+                encoded_targets[tgt_key] = ([constant.SOS_ID, *tgt], [*tgt, constant.EOS_ID], edit.EDIT_TO_ID[edit.get_edit_type(d[0], d[2])])
+            tgt_in, tgt_out, edit_type = encoded_targets[tgt_key]
             processed_sent += [tgt_in]
             processed_sent += [tgt_out]
             processed_sent += [edit_type]
@@ -151,9 +190,13 @@ class DataLoaderCombined:
             raise TypeError
         if key < 0 or key >= len(self.data):
             raise IndexError
-        batch = self.data[key]
-        batch_size = len(batch)
-        batch = list(zip(*batch))
+        if self.batch_cache[key] is None:
+            self.batch_cache[key] = self.build_batch(self.data[key])
+        return self.batch_cache[key]
+
+    def build_batch(self, batch):
+        """ Convert a batch into padded tensors. """
+        batch_size = len(batch[0])
         assert len(batch) == 5
 
         # sort all fields by lens for easy RNN operations
@@ -161,21 +204,28 @@ class DataLoaderCombined:
         batch, orig_idx = sort_all(batch, lens)
 
         # convert to tensors
+        # padding only ever follows the sequence, so masks come straight from the lengths
         src = batch[0]
+        src_lens = torch.LongTensor([len(x) for x in src])
         src = get_long_tensor(src, batch_size)
-        src_mask = torch.eq(src, constant.PAD_ID)
+        src_mask = torch.arange(src.size(1)).unsqueeze(0) >= src_lens.unsqueeze(1)
         lem = batch[1]
+        lem_lens = torch.LongTensor([len(x) for x in lem])
         lem = get_long_tensor(lem, batch_size)
-        lem_mask = torch.eq(lem, constant.PAD_ID)
+        lem_mask = torch.arange(lem.size(1)).unsqueeze(0) >= lem_lens.unsqueeze(1)
         tgt_in = get_long_tensor(batch[2], batch_size)
         tgt_out = get_long_tensor(batch[3], batch_size)
         edits = torch.LongTensor(batch[4])
         assert tgt_in.size(1) == tgt_out.size(1), "Target input and output sequence sizes do not match."
+        if self.pin_memory:
+            src, src_mask, lem, lem_mask, tgt_in, tgt_out, edits = [t.pin_memory() for t in (src, src_mask, lem, lem_mask, tgt_in, tgt_out, edits)]
         return src, src_mask, lem, lem_mask, tgt_in, tgt_out, edits, orig_idx
 
     def __iter__(self):
-        for i in range(self.__len__()):
-            yield self.__getitem__(i)
+        # bucketed training batches are visited in a new random order every epoch
+        order = np.random.permutation(self.__len__()) if self.shuffled else range(self.__len__())
+        for i in order:
+            yield self.__getitem__(int(i))
 
     def load_file(self, filename):
         conll_file = conll.CoNLLFile(filename)
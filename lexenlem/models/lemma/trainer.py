@@ -15,23 +15,18 @@ from lexenlem.models.common import utils, loss
 from lexenlem.models.lemma import edit
 from lexenlem.models.lemma.vocab import MultiVocab
 
-def unpack_batch(batch, use_cuda):
+def unpack_batch(batch, use_cuda, num_inputs=9):
     """ Unpack a batch from the data loader. """
     if use_cuda:
-        inputs = [b.cuda() if b is not None else None for b in batch[:9]]
+        inputs = [b.cuda(non_blocking=True) if b is not None else None for b in batch[:num_inputs]]
     else:
-        inputs = [b if b is not None else None for b in batch[:9]]
-    orig_idx = batch[9]
+        inputs = [b if b is not None else None for b in batch[:num_inputs]]
+    orig_idx = batch[num_inputs]
     return inputs, orig_idx
 
 def unpack_batch_combined(batch, use_cuda):
-    """ Unpack a batch from the data loader. """
-    if use_cuda:
-        inputs = [b.cuda() if b is not None else None for b in batch[:7]]
-    else:
-        inputs = [b if b is not None else None for b in batch[:7]]
-    orig_idx = batch[7]
-    return inputs, orig_idx
+    """ Unpack a batch from the combined data loader. """
+    return unpack_batch(batch, use_cuda, num_inputs=7)
 
 class Trainer(object):
     """ A trainer for training models. """
@@ -94,10 +89,10 @@ class Trainer(object):
 
         self.model.eval()
         batch_size = src.size(0)
-        preds, edit_logits = self.model.predict(src, src_mask, pos=pos, feats=feats, lem=lem, lem_mask=lem_mask, beam_size=beam_size)
-        pred_seqs = [self.vocab['char'].unmap(ids) for ids in preds] # unmap to tokens
-        pred_seqs = utils.prune_decoded_seqs(pred_seqs)
-        pred_tokens = ["".join(seq) for seq in pred_seqs] # join chars to be tokens
+        with torch.no_grad():
+            preds, edit_logits = self.model.predict(src, src_mask, pos=pos, feats=feats, lem=lem, lem_mask=lem_mask, beam_size=beam_size)
+        vocab = self.vocab['char']
+        pred_tokens = ["".join(utils.prune_decoded_seq(vocab.unmap(ids))) for ids in preds] # unmap, prune and join chars to be tokens
         pred_tokens = utils.unsort(pred_tokens, orig_idx)
         if self.args.get('edit', False):
             assert edit_logits is not None
@@ -110,23 +105,16 @@ class Trainer(object):
     def postprocess(self, words, preds, edits=None):
         """ Postprocess, mainly for handing edits. """
         assert len(words) == len(preds), "Lemma predictions must have same length as words."
-        edited = []
         if self.args.get('edit', False):
             assert edits is not None and len(words) == len(edits)
-            for w, p, e in zip(words, preds, edits):
-                lem = edit.edit_word(w, p, e)
-                edited += [lem]
+            edited = [edit.edit_word(w, p, e) for w, p, e in zip(words, preds, edits)]
         else:
             edited = preds # do not edit
         # final sanity check
         assert len(edited) == len(words)
-        final = []
-        for lem, w in zip(edited, words):
-            if len(lem) == 0 or constant.UNK in lem:
-                final += [w] # invalid prediction, fall back to word
-            else:
-                final += [lem]
-        return final
+        unk = constant.UNK
+        # invalid prediction, fall back to word
+        return [w if len(lem) == 0 or unk in lem else lem for lem, w in zip(edited, words)]
 
     def update_lr(self, new_lr):
         utils.change_lr(self.optimizer, new_lr)
@@ -147,46 +135,33 @@ class Trainer(object):
 
     def predict_dict(self, pairs, ignore_empty=False):
         """ Predict a list of lemmas using the dict model given (word, pos) pairs. """
+        composite_get, word_get = self.composite_dict.get, self.word_dict.get
         lemmas = []
-        for p in pairs:
-            w, pos = p
-            if (w,pos) in self.composite_dict:
-                lemmas += [self.composite_dict[(w,pos)]]
-            elif w in self.word_dict:
-                lemmas += [self.word_dict[w]]
-            else:
-                if ignore_empty:
-                    lemmas += ['']
-                else:
-                    lemmas += [w]
+        for w, pos in pairs:
+            lemma = composite_get((w,pos))
+            if lemma is None:
+                lemma = word_get(w)
+            if lemma is None:
+                lemma = '' if ignore_empty else w
+            lemmas.append(lemma)
         return lemmas
 
     def skip_seq2seq(self, pairs):
         """ Determine if we can skip the seq2seq module when ensembling with the frequency lexicon. """
 
-        skip = []
-        for p in pairs:
-            w, pos = p
-            if (w,pos) in self.composite_dict:
-                skip.append(True)
-            elif w in self.word_dict:
-                skip.append(True)
-            else:
-                skip.append(False)
-        return skip
+        composite_dict, word_dict = self.composite_dict, self.word_dict
+        return [(w,pos) in composite_dict or w in word_dict for w, pos in pairs]
 
     def ensemble(self, pairs, other_preds):
         """ Ensemble the dict with statitical model predictions. """
-        lemmas = []
         assert len(pairs) == len(other_preds)
-        for p, pred in zip(pairs, other_preds):
-            w, pos = p
-            if (w,pos) in self.composite_dict:
-                lemmas += [self.composite_dict[(w,pos)]]
-            elif w in self.word_dict:
-                lemmas += [self.word_dict[w]]
-            else:
-                lemmas += [pred]
+        composite_get, word_get = self.composite_dict.get, self.word_dict.get
+        lemmas = []
+        for (w, pos), pred in zip(pairs, other_preds):
+            lemma = composite_get((w,pos))
+            if lemma is None:
+                lemma = word_get(w)
+            lemmas.append(pred if lemma is None else lemma)
         return lemmas
 
     def save(self, filename):
@@ -280,10 +255,10 @@ class TrainerCombined(Trainer):
 
         self.model.eval()
         batch_size = src.size(0)
-        preds, edit_logits, log_attns = self.model.predict(src, src_mask, lem, lem_mask, beam_size=beam_size, log_attn=log_attn)
-        pred_seqs = [self.vocab['combined'].unmap(ids) for ids in preds] # unmap to tokens
-        pred_seqs = utils.prune_decoded_seqs(pred_seqs)
-        pred_tokens = ["".join(seq) for seq in pred_seqs] # join chars to be tokens
+        with torch.no_grad():
+            preds, edit_logits, log_attns = self.model.predict(src, src_mask, lem, lem_mask, beam_size=beam_size, log_attn=log_attn)
+        vocab = self.vocab['combined']
+        pred_tokens = ["".join(utils.prune_decoded_seq(vocab.unmap(ids))) for ids in preds] # unmap, prune and join chars to be tokens
         pred_tokens = utils.unsort(pred_tokens, orig_idx)
         if self.args.get('edit', False):
             assert edit_logits is not None
@@ -1,14 +1,31 @@
 from collections import Counter
 
 from lexenlem.models.common.vocab import BaseVocab, BaseMultiVocab, CompositeVocab
-from lexenlem.models.common.seq2seq_constant import VOCAB_PREFIX
+from lexenlem.models.common.seq2seq_constant import VOCAB_PREFIX, UNK
 
 class Vocab(BaseVocab):
+    @classmethod
+    def from_counter(cls, counter, lang=""):
+        """ Build a vocab from precomputed unit counts instead of a list of units. """
+        return cls(counter, lang)
+
     def build_vocab(self):
         counter = Counter(self.data)
         self._id2unit = VOCAB_PREFIX + list(sorted(list(counter.keys()), key=lambda k: counter[k], reverse=True))
         self._unit2id = {w:i for i, w in enumerate(self._id2unit)}
 
+    def map(self, units):
+        # same as unit2id() per unit, with the lookups bound once for the whole sequence
+        unit2id = self._unit2id
+        unk_id = unit2id[UNK]
+        if self.lower:
+            return [unit2id.get(x.lower(), unk_id) for x in units]
+        return [unit2id.get(x, unk_id) for x in units]
+
+    def unmap(self, ids):
+        id2unit = self._id2unit
+        return [id2unit[i] for i in ids]
+
 class MultiVocab(BaseMultiVocab):
     @classmethod
     def load_state_dict(cls, state_dict):
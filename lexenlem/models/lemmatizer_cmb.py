@@ -23,6 +23,7 @@ from lexenlem.models.lemma.vocab import Vocab
 from lexenlem.models.lemma.trainer import TrainerCombined
 from lexenlem.models.lemma import scorer, edit
 from lexenlem.models.common import utils
+from lexenlem.models.common.doc import Document
 import lexenlem.models.common.seq2seq_constant as constant
 
 def parse_args():
@@ -69,6 +70,7 @@ def parse_args():
     parser.add_argument('--early_stop', type=int, default=10, help="Stop training if dev score doesn't improve after the specified number of epochs.")
     parser.add_argument('--min_epochs', type=int, default=10, help="Minimum number of epochs to train before early stopping gets applied.")
     parser.add_argument('--batch_size', type=int, default=50)
+    parser.add_argument('--num_workers', type=int, default=1, help='Number of processes running the outer lemmatizer during preprocessing.')
     parser.add_argument('--max_grad_norm', type=float, default=5.0, help='Gradient clipping.')
     parser.add_argument('--log_step', type=int, default=20, help='Print log every k steps.')
     parser.add_argument('--model_dir', type=str, default='saved_models/lemma', help='Root dir for saving models.')
@@ -77,6 +79,7 @@ def parse_args():
     parser.add_argument('--seed', type=int, default=1234)
     parser.add_argument('--cuda', type=bool, default=torch.cuda.is_available())
     parser.add_argument('--cpu', action='store_true', help='Ignore CUDA.')
+    parser.add_argument('--quantize', action='store_true', help='Quantize the seq2seq model to int8 for CPU prediction.')
     args = parser.parse_args()
     return args
 
@@ -119,7 +122,7 @@ def train(args):
     if args['lemmatizer'] == 'lexicon':
         lemmatizer = train_batch.lemmatizer
     args['vocab_size'] = vocab['combined'].size
-    dev_batch = DataLoaderCombined(args['eval_file'], args['batch_size'], args, lemmatizer=lemmatizer, vocab=vocab, evaluation=True)
+    dev_batch = DataLoaderCombined(args['eval_file'], args['batch_size'], args, lemmatizer=lemmatizer, vocab=vocab, evaluation=True, sort_during_eval=True)
 
     utils.ensure_dir(args['model_dir'])
     model_file = '{}/{}_lemmatizer.pt'.format(args['model_dir'], args['lang'])
@@ -194,6 +197,9 @@ def train(args):
                     duration = time.time() - start_time
                     print(format_str_dev.format(datetime.now().strftime("%Y-%m-%d %H:%M:%S"), dev_step,\
                             max_dev_steps, epoch, args['num_epoch'], duration))
+            dev_preds = utils.unsort(dev_preds, dev_batch.data_orig_idx)
+            if dev_edits:
+                dev_edits = utils.unsort(dev_edits, dev_batch.data_orig_idx)
             dev_preds = trainer.postprocess(dev_batch.conll.get(['word']), dev_preds, edits=dev_edits)
 
             # try ensembling with dict if necessary
@@ -248,26 +254,34 @@ def evaluate(args):
     trainer = TrainerCombined(model_file=model_file, use_cuda=use_cuda)
     loaded_args, vocab = trainer.args, trainer.vocab
 
+    if args['quantize'] and not use_cuda and trainer.model is not None:
+        print("[Quantizing the seq2seq model...]")
+        trainer.model = torch.quantization.quantize_dynamic(trainer.model, {nn.Linear, nn.LSTM, nn.LSTMCell}, dtype=torch.qint8)
+
     for k in args:
-        if k.endswith('_dir') or k.endswith('_file') or k in ['shorthand']:
+        if k.endswith('_dir') or k.endswith('_file') or k in ['shorthand', 'num_workers']:
             loaded_args[k] = args[k]
-
-    print("[Loading the outer lemmatizer...]")
-    if loaded_args['lemmatizer'] is None:
-        lemmatizer = None
-    elif loaded_args['lemmatizer'] == 'lexicon':
-        print("[Using the lexicon...]")
-        lemmatizer = trainer.lexicon
-    else:
-        print(f"[Loading the {loaded_args['lemmatizer']} lemmatizer...]")
-        lemmatizer = importlib.import_module('lexenlem.lemmatizers.' + loaded_args['lemmatizer'])
+    # the loaders pin batches according to the device used now, not the one the model was trained on
+    loaded_args['cuda'] = use_cuda
+
+    # the dict-only model needs neither the outer lemmatizer nor the seq2seq inputs
+    dict_only = loaded_args.get('dict_only', False)
+    lemmatizer = None
+    if not dict_only:
+        print("[Loading the outer lemmatizer...]")
+        if loaded_args['lemmatizer'] == 'lexicon':
+            print("[Using the lexicon...]")
+            lemmatizer = trainer.lexicon
+        elif loaded_args['lemmatizer'] is not None:
+            print(f"[Loading the {loaded_args['lemmatizer']} lemmatizer...]")
+            lemmatizer = importlib.import_module('lexenlem.lemmatizers.' + loaded_args['lemmatizer'])
 
     # laod data
     print("Loading data with batch size {}...".format(args['batch_size']))
-    batch = DataLoaderCombined(args['eval_file'], args['batch_size'], loaded_args, lemmatizer=lemmatizer, vocab=vocab, evaluation=True)
+    batch = DataLoaderCombined(args['eval_file'], args['batch_size'], loaded_args, lemmatizer=lemmatizer, vocab=vocab, evaluation=True, conll_only=True)
 
     # skip eval if dev data does not exist
-    if len(batch) == 0:
+    if len(batch.conll) == 0:
         print("Skip evaluation because no dev data is available...")
         print("Lemma score:")
         print("{} ".format(args['lang']))
@@ -275,14 +289,24 @@ def evaluate(args):
 
     dict_preds = trainer.predict_dict(batch.conll.get(['word', 'upos']))
 
-    if loaded_args.get('dict_only', False):
+    if dict_only:
         preds = dict_preds
     else:
-        print("Running the seq2seq model...")
+        # words found in the dict are overridden when ensembling, so the seq2seq model can skip them
+        if loaded_args.get('ensemble_dict', False) and not args['log_attn']:
+            skip = trainer.skip_seq2seq(batch.conll.get(['word', 'upos']))
+        else:
+            skip = [False] * len(dict_preds)
+        # reuse the already parsed eval file instead of reading it again
+        doc = Document('')
+        doc.conll_file = batch.conll
+        seq2seq_batch = DataLoaderCombined(doc, args['batch_size'], loaded_args, lemmatizer=lemmatizer, vocab=vocab, evaluation=True, skip=skip, sort_during_eval=not args['log_attn'])
+
+        print("Running the seq2seq model on {} of {} words...".format(seq2seq_batch.num_examples, len(skip)))
         preds = []
         edits = []
         log_attns = {}
-        for i, b in enumerate(batch):
+        for i, b in enumerate(seq2seq_batch):
             ps, es, attns = trainer.predict(b, args['beam_size'], log_attn=args['log_attn'])
             if attns:
                 for k, _ in attns.items():
@@ -311,7 +335,14 @@ def evaluate(args):
             fname = ''.join([args['lang'], '_', lem_name])
             print(f'[Logging attention to {fname}.npz...]')
             np.savez(fname, **log_attns)
-        preds = trainer.postprocess(batch.conll.get(['word']), preds, edits=edits)
+        if seq2seq_batch.data_orig_idx is not None and preds:
+            preds = utils.unsort(preds, seq2seq_batch.data_orig_idx)
+            if edits:
+                edits = utils.unsort(edits, seq2seq_batch.data_orig_idx)
+        seq2seq_words = [w for w, s in zip(batch.conll.get(['word']), skip) if not s]
+        seq2seq_preds = iter(trainer.postprocess(seq2seq_words, preds, edits=edits))
+        # expand seq2seq predictions back to all words
+        preds = ['' if s else next(seq2seq_preds) for s in skip]
 
         if loaded_args.get('ensemble_dict', False):
             print("[Ensembling dict with seq2seq lemmatizer...]")
@@ -3,32 +3,27 @@ import argparse
 from typing import List, NamedTuple
 import numpy as np
 from pathlib import Path
-from collections import namedtuple, defaultdict
+from collections import namedtuple
+from operator import eq
 
 def load_file(filename):
-    """Loads the CONLL file"""
+    """Loads the lemmas from the CONLL file, streaming it one sentence at a time"""
     conll_file = conll.CoNLLFile(filename)
-    data = conll_file.get(['lemma'], as_sentences=True)
+    data = list(conll_file.iter_fields(['lemma']))
     return data
 
 
-def system_score(gold: List[str], system: List[str]) -> int:
-    """Returns the accuracy of the system"""
+def sentence_counts(gold: List[str], system: List[str]):
+    """Returns the number of correct lemmas and the number of lemmas in each sentence"""
     assert len(gold) == len(system), "The gold and system predictions are not of the same length."
+    assert all(len(gold_sent) == len(system_sent) for gold_sent, system_sent in zip(gold, system)), \
+        "The gold and system sentences do not have the same number of tokens."
 
-    score = 0
-    total = 0
-    correct = 0
+    correct = np.fromiter((sum(map(eq, gold_sent, system_sent)) for gold_sent, system_sent in zip(gold, system)),
+                          dtype=np.int64, count=len(gold))
+    total = np.fromiter((len(gold_sent) for gold_sent in gold), dtype=np.int64, count=len(gold))
 
-    for i in range(len(gold)):
-        for j in range(len(gold[i])):
-            total += 1
-            if gold[i][j] == system[i][j]:
-                correct += 1
-    
-    score = correct / total
-
-    return score
+    return correct, total
 
 
 def paired_bootstrap(gold: List[str], systems: List[NamedTuple], 
@@ -44,50 +39,40 @@ def paired_bootstrap(gold: List[str], systems: List[NamedTuple],
         assert len(gold) == len(system.sents), \
             f"The gold ({len(gold)}) and {system.name} ({len(system.sents)}) predictions are not of the same length."
 
-    system_scores = defaultdict(list)
-    wins = defaultdict(int)
-
     n = len(gold)
-    idx = list(range(n))
     alpha = (1 - confidence/100) / 2
     index_lo = int(alpha * (num_samples - 1))
     index_hi = num_samples - 1 - index_lo
     index_mid = int(num_samples / 2)
 
     # Resampling the sets for each system and comparing with the gold
+    # All systems are scored on the same resamples, one row of sentence indices per sample
     print('Resampling...')
-    for system in systems:
+    idx_shuffled = np.random.randint(0, n, size=(num_samples, n))
+    scores_mat = np.empty((len(systems), num_samples), dtype=np.float64)
+    for i_system, system in enumerate(systems):
         print(f'Resampling {system.name}...')
-        for i in range(num_samples):
-            idx_shuffled = np.random.choice(idx, size=n)
-            gold_shuffled = [gold[i] for i in idx_shuffled]
-            system_shuffled = [system.sents[i] for i in idx_shuffled]
-            score = system_score(gold_shuffled, system_shuffled)
-            system_scores[system.name].append(score)
+        # a resampled score only depends on the per-sentence counts, so compare the sentences once
+        correct, total = sentence_counts(gold, system.sents)
+        scores_mat[i_system] = correct[idx_shuffled].sum(axis=1) / total[idx_shuffled].sum(axis=1)
 
     # Counting the wins of each system and raking them from the highers to lowest
     # Average accuracy is used for sorting
-    final = []
     print('Ranking the systems...')
-    for i_system in range(len(systems)):
-        i_name = systems[i_system].name
-        for j_system in range(i_system):
-            j_name = systems[j_system].name
-            for i, j in zip(system_scores[i_name], system_scores[j_name]):
-                if i > j:
-                    wins[(i_name, j_name)] += 1
-                elif i < j:
-                    wins[(j_name, i_name)] += 1
-        scores = sorted(system_scores[i_name])
-        final.append([i_name, scores[index_mid], scores[index_hi], scores[index_lo]])
+    # wins_mat[i, j] is the number of samples in which system i scored higher than system j
+    wins_mat = (scores_mat[:, None, :] > scores_mat[None, :, :]).sum(axis=2)
+    sorted_scores = np.sort(scores_mat, axis=1)
+    final = [[i_system, sorted_scores[i_system, index_mid], sorted_scores[i_system, index_hi], sorted_scores[i_system, index_lo]]
+             for i_system in range(len(systems))]
 
     sorted_systems = sorted(final, key=lambda x: x[1], reverse=True)
 
     for rank, results in enumerate(sorted_systems):
-        system_name, mid, hi, lo = results
+        i_system, mid, hi, lo = results
+        system_name = systems[i_system].name
         if rank < len(systems) - 1:
             lower_rank_system = sorted_systems[rank + 1][0]
-            p_value = (wins[(lower_rank_system, system_name)] + 1) / (num_samples + 1)
+            p_value = (wins_mat[lower_rank_system, i_system] + 1) / (num_samples + 1)
             p_string = f'p={p_value:.3f}'
         else:
             p_value = 1